@@ -0,0 +1,185 @@
+import os
+import re
+import time
+import heapq
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+from logger import logger
+
+# Admission control in front of ChatHandler. Requests carry a deadline (X-Request-Timeout-Ms header or
+# CHAT_DEFAULT_DEADLINE_MS) and wait in a bounded priority queue for one of CHAT_MAX_CONCURRENCY slots.
+# Cheap requests (greetings, contact details) are served ahead of RAG requests, and work whose deadline
+# has passed is dropped before any LLM call is made.
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+DEFAULT_DEADLINE_MS = int(os.getenv("CHAT_DEFAULT_DEADLINE_MS", 30000))
+MAX_DEADLINE_MS = int(os.getenv("CHAT_MAX_DEADLINE_MS", 60000))  # nginx proxy_read_timeout
+MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", 4))
+MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", 8))
+# Gunicorn threads kept free of chat work, for the healthcheck and for answering 503s once the queue is full.
+# gunicorn.conf.py sizes the worker to MAX_CONCURRENCY + MAX_QUEUE + SPARE_THREADS, so every chat request
+# that is running or queued holds a thread inside the app rather than waiting in gunicorn's accept backlog.
+SPARE_THREADS = int(os.getenv("CHAT_SPARE_THREADS", 2))
+
+PRIORITY_CHEAP = 0
+PRIORITY_RAG = 1
+
+# A greeting that opens the message, or an explicit request for contact details. Words like "number"
+# or "reach" on their own also appear in ordinary portfolio questions, so they don't count.
+_greeting_pattern = re.compile(
+    r"^\W*(hi|hello|hey|hiya|greetings|good (morning|afternoon|evening))\b",
+    re.IGNORECASE
+)
+_contact_pattern = re.compile(
+    r"\b(contact (details|info|information|number)|e-?mail (address|id)|phone number|mobile number|"
+    r"linkedin (profile|url|id|account)|(your|his) (contact|e-?mail|phone|linkedin)|"
+    r"(contact|reach|email|call) (you|him|shivam))\b",
+    re.IGNORECASE
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when the admission queue is full"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline passes before its LLM work could start"""
+
+
+def estimate_priority(message: str) -> int:
+    """
+    Cheaply guess whether a message will be answered without RAG, before it is classified.
+
+    Messages that are little more than a greeting, or short requests for contact details, are prioritized;
+    everything else is treated as a RAG request. A wrong guess only affects queue order, not the answer.
+    """
+    words = len(message.split())
+    if (words <= 4 and _greeting_pattern.search(message)) or (words <= 8 and _contact_pattern.search(message)):
+        return PRIORITY_CHEAP
+    return PRIORITY_RAG
+
+
+def request_deadline(header_value: Optional[str], received_at: float) -> float:
+    """
+    Absolute deadline (time.monotonic() based) for a request received at `received_at`.
+
+    Args:
+        header_value: Remaining client budget in milliseconds from the X-Request-Timeout-Ms header, if any
+        received_at: time.monotonic() when the request reached the view
+
+    Returns:
+        float: Deadline, using the default budget when the header is missing or invalid
+    """
+    budget_ms = DEFAULT_DEADLINE_MS
+    if header_value:
+        try:
+            budget_ms = min(max(int(header_value), 0), MAX_DEADLINE_MS)
+        except ValueError:
+            logger.warning(f"Ignoring invalid {DEADLINE_HEADER} header: {header_value}")
+    return received_at + budget_ms / 1000
+
+
+def check_deadline(deadline: Optional[float]) -> None:
+    """Raise DeadlineExceeded if the deadline has already passed"""
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded("Request deadline passed before processing")
+
+
+class AdmissionController():
+    """
+    Bounded, deadline-aware priority queue limiting how many chat requests run at once.
+
+    Waiting requests are served in (priority, deadline) order, so cheap requests go ahead of RAG ones.
+    A request arriving at a full queue is rejected; queued work is never displaced.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, wait_samples: int = 500):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._queue: list = []  # heap of (priority, deadline, seq)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._waits_ms = deque(maxlen=wait_samples)
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.expired = 0
+        self.max_depth_seen = 0
+
+    @contextmanager
+    def admit(self, priority: int, deadline: float) -> Iterator[None]:
+        """
+        Hold a processing slot for the duration of the block.
+
+        Raises:
+            AdmissionRejected: If the queue is full.
+            DeadlineExceeded: If the deadline passes before a slot becomes free.
+        """
+        self._acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _acquire(self, priority: int, deadline: float) -> None:
+        enqueued_at = time.monotonic()
+        with self._cond:
+            if enqueued_at >= deadline:
+                self.expired += 1
+                raise DeadlineExceeded("Request deadline passed before admission")
+            if self._in_flight < self.max_concurrency and not self._queue:
+                self._start(enqueued_at)
+                return
+
+            if len(self._queue) >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise AdmissionRejected("Admission queue is full")
+            entry = (priority, deadline, next(self._seq))
+            heapq.heappush(self._queue, entry)
+            self.max_depth_seen = max(self.max_depth_seen, len(self._queue))
+            self._cond.notify_all()
+
+            while True:
+                if self._queue[0] is entry and self._in_flight < self.max_concurrency:
+                    heapq.heappop(self._queue)
+                    self._start(enqueued_at)
+                    self._cond.notify_all()  # The next waiter may also fit
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self.expired += 1
+                    self._cond.notify_all()
+                    raise DeadlineExceeded("Request deadline passed while queued")
+                self._cond.wait(remaining)
+
+    def _start(self, enqueued_at: float) -> None:
+        # Caller must hold the lock
+        self._in_flight += 1
+        self.admitted += 1
+        self._waits_ms.append((time.monotonic() - enqueued_at) * 1000)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue depth and wait-time metrics for health reporting"""
+        with self._cond:
+            waits = sorted(self._waits_ms)
+            return {
+                "queue_depth": len(self._queue),
+                "max_queue_depth_seen": self.max_depth_seen,
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_queue_full,
+                "expired": self.expired,
+                "wait_ms_avg": round(sum(waits) / len(waits), 1) if waits else 0.0,
+                "wait_ms_p95": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 1) if waits else 0.0,
+                "wait_ms_max": round(waits[-1], 1) if waits else 0.0,
+            }
+
+
+admission = AdmissionController(MAX_CONCURRENCY, MAX_QUEUE)
@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import aclosing
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+from channels.generic.websocket import AsyncJsonWebsocketConsumer #type: ignore
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from main import OUT_OF_SCOPE_MESSAGE, ERROR_MESSAGE
+from circuitbreaker import CircuitBreakerOpenError, groq_breaker
+from chatbackend.views import chat_backend
+from logger import logger
+
+HISTORY_WINDOW = 3  # Same number of messages get_session_history reads from Redis
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    WebSocket chat endpoint bound to a single session.
+
+    The session history is read from Redis once on connect and then kept in connection memory.
+    Each message goes through the same filtering, classification and RAG steps as ChatHandler,
+    portfolio answers are streamed back token by token, and both sides of the conversation are
+    persisted to Redis in the background in the order they happened.
+
+    Client -> server: {"message": "..."}
+    Server -> client: {"type": "session", "session_id"}, {"type": "token", "token"},
+                      {"type": "message", "message", "session_id"}, {"type": "error", "error"}
+    """
+
+    async def connect(self) -> None:
+        if chat_backend is None:
+            logger.error("Chat backend not available")
+            await self.close(code=1013)  # Try again later
+            return
+
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        self.session_id: str = (query.get("session_id") or [""])[0].strip() or chat_backend.generate_session_id()
+        self.history_key = f"chat_history:{self.session_id}"
+        stored_history = await asyncio.to_thread(chat_backend.get_session_history, self.session_id)
+        self.history: List[BaseMessage] = list(stored_history.messages)[-HISTORY_WINDOW:]
+        self.pending_writes: asyncio.Queue = asyncio.Queue()
+        self.writer = asyncio.create_task(self._persist_writes())
+
+        await self.accept()
+        await self.send_json({"type": "session", "session_id": self.session_id})
+        logger.info(f"WebSocket connected for session {self.session_id}")
+
+    async def disconnect(self, code: int) -> None:
+        writer: Optional[asyncio.Task] = getattr(self, "writer", None)
+        if writer is not None:
+            await self.pending_writes.put(None)  # Flush queued writes before the connection goes away
+            await writer
+        logger.info(f"WebSocket disconnected for session {getattr(self, 'session_id', None)} ({code})")
+
+    async def _persist_writes(self) -> None:
+        """Persist queued messages to Redis one at a time so they keep their conversation order"""
+        while True:
+            item = await self.pending_writes.get()
+            if item is None:
+                return
+            role, content = item
+            await asyncio.to_thread(chat_backend.persist_message, self.history_key, role, content)
+
+    def _remember(self, message: BaseMessage, role: str) -> None:
+        self.history = (self.history + [message])[-HISTORY_WINDOW:]
+        self.pending_writes.put_nowait((role, message.content))
+
+    async def _send_message(self, message: str) -> None:
+        await self.send_json({"type": "message", "message": message, "session_id": self.session_id})
+
+    async def receive_json(self, content: Dict[str, Any], **kwargs: Any) -> None:
+        message = content.get("message") if isinstance(content, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            logger.warning("Invalid or empty message received over WebSocket")
+            await self.send_json({"type": "error", "error": "Message is required and must be a non-empty string"})
+            return
+
+        if chat_backend.filter_input(message):
+            await self._send_message(OUT_OF_SCOPE_MESSAGE)
+            return
+
+        self._remember(HumanMessage(content=message), "human")
+        context_task: Optional[asyncio.Task] = None
+        try:
+            if chat_backend.should_speculate(message):
+                # Retrieve alongside classification; history is already in memory
+                context_task = asyncio.create_task(asyncio.to_thread(chat_backend.retrieve_context, message))
+            category = await groq_breaker.acall(chat_backend.classification_chain().ainvoke, message)
+
+            if category == "PortfolioQuestion":
+                context = await context_task if context_task else await asyncio.to_thread(chat_backend.retrieve_context, message)
+                tokens = []
+                # aclosing releases the breaker trial promptly if sending fails mid-stream
+                async with aclosing(chat_backend.astream_rag_response(message, self.history, context)) as stream:
+                    async for token in stream:
+                        tokens.append(token)
+                        await self.send_json({"type": "token", "token": token})
+                response = "".join(tokens)
+            elif category == "Greeting":
+                response = chat_backend.greetings_msg()
+            elif category == "Contact":
+                response = chat_backend.contact_info()
+            else:
+                response = OUT_OF_SCOPE_MESSAGE
+        except CircuitBreakerOpenError as e:
+            logger.warning(f"Skipping response generation ---{e}")
+            await self._send_message(ERROR_MESSAGE)
+            return
+        except Exception as e:
+            logger.error(f"Error generating WebSocket response ---{e}")
+            await self._send_message(ERROR_MESSAGE)
+            return
+        finally:
+            if context_task is not None and not context_task.done():
+                context_task.cancel()
+
+        self._remember(AIMessage(content=response), "ai")
+        await self._send_message(response)
+        logger.info(f"Processed WebSocket message for session {self.session_id}")
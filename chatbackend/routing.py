@@ -0,0 +1,6 @@
+from django.urls import path
+from chatbackend.consumers import ChatConsumer
+
+websocket_urlpatterns = [
+    path('ws/chat/', ChatConsumer.as_asgi(), name='chat_socket')
+]
@@ -0,0 +1,224 @@
+import time
+import threading
+import unittest
+from unittest import mock
+from circuitbreaker import CircuitBreaker, CircuitBreakerOpenError, CircuitBreakerTimeout, CLOSED, OPEN, HALF_OPEN
+from admission import (AdmissionController, AdmissionRejected, DeadlineExceeded, estimate_priority,
+                       PRIORITY_CHEAP, PRIORITY_RAG)
+
+
+class FakeClock():
+    """Stands in for time.monotonic so cool-downs can be crossed without sleeping"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("circuitbreaker.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker("test", failure_rate_threshold=0.5, window_size=4,
+                                      minimum_calls=4, cooldown_seconds=30.0)
+
+    def record_fail(self, permit=None):
+        self.breaker.record_failure(permit or self.breaker.allow_request())
+
+    def record_ok(self, permit=None):
+        self.breaker.record_success(permit or self.breaker.allow_request())
+
+    def open_breaker(self):
+        for _ in range(4):
+            self.record_fail()
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_opens_only_once_minimum_calls_reach_failure_rate(self):
+        self.record_ok()
+        self.record_fail()
+        self.record_fail()
+        self.assertEqual(self.breaker.state, CLOSED)  # 2 of 3 failed, below minimum_calls
+        self.record_fail()
+        self.assertEqual(self.breaker.state, OPEN)    # 3 of 4 failed
+
+    def test_stays_closed_below_failure_rate(self):
+        self.record_fail()
+        for _ in range(3):
+            self.record_ok()
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_open_breaker_fails_fast(self):
+        self.open_breaker()
+        self.assertIsNone(self.breaker.allow_request())
+        with self.assertRaises(CircuitBreakerOpenError):
+            self.breaker.call(lambda: "unreachable")
+
+    def test_half_open_allows_a_single_trial(self):
+        self.open_breaker()
+        self.clock.advance(30)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        trial = self.breaker.allow_request()
+        self.assertTrue(trial.trial)
+        self.assertIsNone(self.breaker.allow_request())
+
+    def test_trial_success_closes_and_trial_failure_reopens(self):
+        self.open_breaker()
+        self.clock.advance(30)
+        self.record_ok()
+        self.assertEqual(self.breaker.state, CLOSED)
+
+        self.open_breaker()
+        self.clock.advance(30)
+        self.record_fail()
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_stale_success_does_not_close_half_open_breaker(self):
+        slow_call = self.breaker.allow_request()  # Admitted while closed
+        self.open_breaker()
+        self.clock.advance(30)
+        self.breaker.record_success(slow_call)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+
+    def test_stale_cancellation_does_not_free_trial_slot(self):
+        slow_call = self.breaker.allow_request()
+        self.open_breaker()
+        self.clock.advance(30)
+        self.assertIsNotNone(self.breaker.allow_request())
+        self.breaker.release(slow_call)
+        self.assertIsNone(self.breaker.allow_request())
+
+    def test_cancelled_trial_frees_its_slot(self):
+        self.open_breaker()
+        self.clock.advance(30)
+
+        def cancelled():
+            raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            self.breaker.call(cancelled)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertIsNotNone(self.breaker.allow_request())
+
+    def test_abandoned_trial_is_written_off_after_cooldown(self):
+        self.open_breaker()
+        self.clock.advance(30)
+        abandoned = self.breaker.allow_request()
+        self.clock.advance(30)
+        retry = self.breaker.allow_request()
+        self.assertIsNotNone(retry)
+        self.breaker.record_success(abandoned)  # Reports back after being written off
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.breaker.record_success(retry)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+
+class CircuitBreakerTimeoutTests(unittest.TestCase):
+    def test_slow_call_times_out_and_counts_as_failure(self):
+        breaker = CircuitBreaker("slow", minimum_calls=1, timeout_seconds=0.05, timeout_workers=1)
+        with self.assertRaises(CircuitBreakerTimeout):
+            breaker.call(time.sleep, 0.5)
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_breakers_do_not_share_timeout_pools(self):
+        hung = CircuitBreaker("hung", minimum_calls=10, timeout_seconds=0.05, timeout_workers=1)
+        healthy = CircuitBreaker("healthy", minimum_calls=10, timeout_seconds=0.5, timeout_workers=1)
+        with self.assertRaises(CircuitBreakerTimeout):
+            hung.call(time.sleep, 0.5)  # Still holds hung's only worker
+        self.assertEqual(healthy.call(lambda: "ok"), "ok")
+
+
+class AdmissionControllerTests(unittest.TestCase):
+    def setUp(self):
+        self.admission = AdmissionController(max_concurrency=1, max_queue=2)
+        self.release = threading.Event()
+        self.outcomes = []
+        self.threads = []
+        self.addCleanup(self.finish)
+
+    def finish(self):
+        self.release.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+
+    def submit(self, name, priority, budget=5.0, hold=False):
+        """Request a slot from a new thread and record the order requests get in (or fail)"""
+        deadline = time.monotonic() + budget
+
+        def run():
+            try:
+                with self.admission.admit(priority, deadline):
+                    self.outcomes.append(name)
+                    if hold:
+                        self.release.wait(5)
+            except (AdmissionRejected, DeadlineExceeded) as e:
+                self.outcomes.append(f"{name}:{type(e).__name__}")
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.threads.append(thread)
+
+    def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail("condition not reached")
+
+    def test_cheap_requests_run_before_queued_rag_requests(self):
+        self.submit("running", PRIORITY_RAG, hold=True)
+        self.wait_for(lambda: self.admission.snapshot()["in_flight"] == 1)
+        self.submit("rag", PRIORITY_RAG)
+        self.wait_for(lambda: self.admission.snapshot()["queue_depth"] == 1)
+        self.submit("greeting", PRIORITY_CHEAP)
+        self.wait_for(lambda: self.admission.snapshot()["queue_depth"] == 2)
+        self.release.set()
+        self.finish()
+        self.assertEqual(self.outcomes, ["running", "greeting", "rag"])
+
+    def test_full_queue_rejects_newcomer_without_displacing_queued_work(self):
+        self.submit("running", PRIORITY_RAG, hold=True)
+        self.wait_for(lambda: self.admission.snapshot()["in_flight"] == 1)
+        self.submit("rag-1", PRIORITY_RAG)
+        self.submit("rag-2", PRIORITY_RAG)
+        self.wait_for(lambda: self.admission.snapshot()["queue_depth"] == 2)
+        self.submit("greeting", PRIORITY_CHEAP)
+        self.wait_for(lambda: "greeting:AdmissionRejected" in self.outcomes)
+        self.release.set()
+        self.finish()
+        self.assertEqual(sorted(self.outcomes), ["greeting:AdmissionRejected", "rag-1", "rag-2", "running"])
+        self.assertEqual(self.admission.snapshot()["rejected_queue_full"], 1)
+
+    def test_queued_request_expires_at_its_deadline(self):
+        self.submit("running", PRIORITY_RAG, hold=True)
+        self.wait_for(lambda: self.admission.snapshot()["in_flight"] == 1)
+        self.submit("impatient", PRIORITY_RAG, budget=0.05)
+        self.wait_for(lambda: "impatient:DeadlineExceeded" in self.outcomes)
+        snapshot = self.admission.snapshot()
+        self.assertEqual(snapshot["queue_depth"], 0)
+        self.assertEqual(snapshot["expired"], 1)
+
+    def test_expired_request_is_never_admitted(self):
+        with self.assertRaises(DeadlineExceeded):
+            with self.admission.admit(PRIORITY_CHEAP, time.monotonic() - 1):
+                pass
+        self.assertEqual(self.admission.snapshot()["admitted"], 0)
+
+
+class EstimatePriorityTests(unittest.TestCase):
+    def test_greetings_and_contact_requests_are_cheap(self):
+        for message in ["Hi there!", "hello", "How can I contact you?", "What is your email address?"]:
+            self.assertEqual(estimate_priority(message), PRIORITY_CHEAP, message)
+
+    def test_portfolio_questions_are_not_cheap(self):
+        for message in ["What number of projects has he shipped?", "Which calls does the API make?",
+                        "Hi, which projects used Django and Redis?", "Do you use LinkedIn APIs?"]:
+            self.assertEqual(estimate_priority(message), PRIORITY_RAG, message)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,15 @@
+import time
 from typing import Optional, Dict, Any
 from django.http import JsonResponse #type: ignore
 from rest_framework import status #type: ignore
 from rest_framework.decorators import api_view #type: ignore
 from rest_framework.request import Request
 from rest_framework.response import Response
-from main import ChatModelPortfolio
+from main import ChatModelPortfolio, speculation_stats
+from circuitbreaker import breaker_states
+from requestprofiler import profile_request, PROFILE_HEADER
+from admission import (admission, estimate_priority, request_deadline, AdmissionRejected,
+                       DeadlineExceeded, DEADLINE_HEADER)
 from logger import logger
 # Initialize chat backend with error handling
 try:
@@ -21,18 +26,24 @@ def healthcheck(request: Request)-> JsonResponse:
         request: Django HTTP request object
 
     Returns:
-        JsonResponse: Status message indicating chatbot readiness
+        JsonResponse: Status message indicating chatbot readiness, dependency circuit breaker states,
+            speculative retrieval statistics and admission queue metrics
     """
     try:
             if chat_backend is None:
                 logger.warning("Chat backend is not initialized")
                 return JsonResponse(
-                    {"message": "Chatbot is not ready"},
+                    {"message": "Chatbot is not ready", "circuit_breakers": breaker_states()},
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
             
             return JsonResponse(
-                {"message": "Chatbot is ready"},
+                {
+                    "message": "Chatbot is ready",
+                    "circuit_breakers": breaker_states(),
+                    "speculation": speculation_stats.snapshot(),
+                    "admission": admission.snapshot()
+                },
                 status=status.HTTP_200_OK
             )
     except Exception as e:
@@ -47,12 +58,16 @@ def chat_worker(request: Request) -> Response:
     """
     Process chat messages and return responses.
 
+    Requests pass through the admission queue first; the optional X-Request-Timeout-Ms header sets how
+    long the client will wait, and work still queued past that deadline is dropped before any LLM call.
+
     Args:
         request: Django REST framework request object containing message and optional session_id
 
     Returns:
         Response: JSON response with message and session_id or error details
     """
+    received_at = time.monotonic()
     try:
         if request.method != 'POST':
             logger.warning(f"Invalid method: {request.method}")
@@ -88,8 +103,11 @@ def chat_worker(request: Request) -> Response:
             )
 
         # Process chat message
+        deadline = request_deadline(request.headers.get(DEADLINE_HEADER), received_at)
         try:
-            response = chat_backend.ChatHandler(message, session_id)
+            with admission.admit(estimate_priority(message), deadline):
+                with profile_request(request.headers.get(PROFILE_HEADER), session_id):
+                    response = chat_backend.ChatHandler(message, session_id, deadline)
             logger.info(f"Processed message for session {session_id}")
             
             return Response(
@@ -99,6 +117,19 @@ def chat_worker(request: Request) -> Response:
                 },
                 status=status.HTTP_200_OK
             )
+        except AdmissionRejected as e:
+            logger.warning(f"Rejected chat message for session {session_id}: {str(e)}")
+            return Response(
+                {"error": "Chat service is busy, please try again"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "5"}
+            )
+        except DeadlineExceeded as e:
+            logger.warning(f"Dropped chat message for session {session_id}: {str(e)}")
+            return Response(
+                {"error": "Request deadline exceeded"},
+                status=status.HTTP_504_GATEWAY_TIMEOUT
+            )
         except Exception as e:
             logger.error(f"Error processing chat message: {str(e)}")
             return Response(
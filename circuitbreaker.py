@@ -0,0 +1,256 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Optional
+from logger import logger
+from requestprofiler import propagate
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreakerOpenError(Exception):
+    """Raised when a call is short-circuited because the breaker is open"""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit breaker '{name}' is open")
+        self.name = name
+
+
+class CircuitBreakerTimeout(TimeoutError):
+    """Raised when a call through the breaker does not finish within its timeout"""
+
+    def __init__(self, name: str, timeout: float):
+        super().__init__(f"Call through circuit breaker '{name}' timed out after {timeout}s")
+        self.name = name
+
+
+class Permit():
+    """
+    Permission for one call, returned by CircuitBreaker.allow_request.
+
+    The permit remembers the breaker generation it was issued in and whether it is a half-open
+    trial, so an outcome reported after the breaker has moved on cannot change its state.
+    """
+    __slots__ = ("generation", "trial")
+
+    def __init__(self, generation: int, trial: bool):
+        self.generation = generation
+        self.trial = trial
+
+
+class CircuitBreaker():
+    """
+    Per-dependency circuit breaker with closed, open and half-open states.
+
+    The breaker tracks the outcome of the last `window_size` calls. Once at least
+    `minimum_calls` have been recorded and the failure rate reaches `failure_rate_threshold`
+    it opens, and every call fails fast until `cooldown_seconds` have passed. After the
+    cool-down a limited number of trial calls are let through (half-open); a trial success
+    closes the breaker again and a trial failure re-opens it. A trial that never reports back
+    is written off after another `cooldown_seconds`, so the breaker cannot stay half-open forever.
+
+    Every open, close or written-off trial starts a new generation. Outcomes are only counted
+    for permits from the current generation, so a slow call admitted while closed cannot close
+    a half-open breaker or free a trial slot.
+
+    When `timeout_seconds` is set, calls run on the breaker's own thread pool and count as
+    failures if they take longer. A hung dependency can only exhaust its own pool.
+    """
+
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5, window_size: int = 10,
+                 minimum_calls: int = 4, cooldown_seconds: float = 30.0, half_open_max_calls: int = 1,
+                 timeout_seconds: Optional[float] = None, timeout_workers: int = 8):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.cooldown_seconds = cooldown_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.timeout_seconds = timeout_seconds
+        self._outcomes = deque(maxlen=window_size)  # True for failure, False for success
+        self._state = CLOSED
+        self._generation = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._half_open_granted_at = 0.0
+        self._lock = threading.Lock()
+        # A timed-out call keeps its worker until the client gives up, but the caller returns after
+        # `timeout_seconds` either way.
+        self._executor = ThreadPoolExecutor(
+            max_workers=timeout_workers, thread_name_prefix=f"breaker-{name}"
+        ) if timeout_seconds is not None else None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self) -> None:
+        # Caller must hold the lock. Moves an expired open breaker to half-open, and frees the
+        # trial slots again if the last trial was granted a full cool-down ago without reporting back.
+        now = time.monotonic()
+        if self._state == OPEN and now - self._opened_at >= self.cooldown_seconds:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+            logger.info(f"Circuit breaker '{self.name}' is half-open, allowing trial calls")
+        elif (self._state == HALF_OPEN and self._half_open_calls >= self.half_open_max_calls
+              and now - self._half_open_granted_at >= self.cooldown_seconds):
+            self._generation += 1  # Ignore the abandoned trial if it ever reports back
+            self._half_open_calls = 0
+            logger.warning(f"Circuit breaker '{self.name}' trial call never completed, allowing a new trial")
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._generation += 1
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        logger.warning(f"Circuit breaker '{self.name}' opened, failing fast for {self.cooldown_seconds}s")
+
+    def _close(self) -> None:
+        self._state = CLOSED
+        self._generation += 1
+        self._outcomes.clear()
+        logger.info(f"Circuit breaker '{self.name}' closed")
+
+    def allow_request(self) -> Optional[Permit]:
+        """Return a Permit if a call to the dependency may be attempted now, else None"""
+        with self._lock:
+            self._refresh_state()
+            if self._state == CLOSED:
+                return Permit(self._generation, trial=False)
+            if self._state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                self._half_open_granted_at = time.monotonic()
+                return Permit(self._generation, trial=True)
+            return None
+
+    def release(self, permit: Permit) -> None:
+        """Record a neutral outcome for a permitted call that was abandoned (e.g. cancelled) before finishing"""
+        with self._lock:
+            if permit.trial and permit.generation == self._generation and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self, permit: Permit) -> None:
+        with self._lock:
+            if permit.generation != self._generation:
+                return  # Issued before the last state change
+            if self._state == HALF_OPEN:
+                if permit.trial:
+                    self._close()
+                return
+            self._outcomes.append(False)
+
+    def record_failure(self, permit: Permit) -> None:
+        with self._lock:
+            if permit.generation != self._generation:
+                return  # Issued before the last state change
+            if self._state == HALF_OPEN:
+                if permit.trial:
+                    self._open()
+                return
+            self._outcomes.append(True)
+            if len(self._outcomes) >= self.minimum_calls:
+                failure_rate = sum(self._outcomes) / len(self._outcomes)
+                if failure_rate >= self.failure_rate_threshold:
+                    self._open()
+
+    def call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Invoke `func` through the breaker.
+
+        Raises:
+            CircuitBreakerOpenError: If the breaker is open and the call was skipped.
+        """
+        permit = self.allow_request()
+        if permit is None:
+            raise CircuitBreakerOpenError(self.name)
+        try:
+            if self._executor is None:
+                result = func(*args, **kwargs)
+            else:
+                future = self._executor.submit(propagate(func), *args, **kwargs)
+                try:
+                    result = future.result(timeout=self.timeout_seconds)
+                except FutureTimeoutError:
+                    future.cancel()
+                    raise CircuitBreakerTimeout(self.name, self.timeout_seconds) from None
+        except Exception:
+            self.record_failure(permit)
+            raise
+        except BaseException:
+            self.release(permit)
+            raise
+        self.record_success(permit)
+        return result
+
+    async def acall(self, func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """
+        Await `func` through the breaker.
+
+        Raises:
+            CircuitBreakerOpenError: If the breaker is open and the call was skipped.
+        """
+        permit = self.allow_request()
+        if permit is None:
+            raise CircuitBreakerOpenError(self.name)
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            self.record_failure(permit)
+            raise
+        except BaseException: # asyncio.CancelledError
+            self.release(permit)
+            raise
+        self.record_success(permit)
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current breaker state for health reporting"""
+        with self._lock:
+            self._refresh_state()
+            failures = sum(self._outcomes)
+            snapshot: Dict[str, Any] = {
+                "state": self._state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": failures,
+            }
+            if self._state == OPEN:
+                remaining = self.cooldown_seconds - (time.monotonic() - self._opened_at)
+                snapshot["retry_in_seconds"] = round(max(remaining, 0.0), 1)
+            return snapshot
+
+
+def _breaker_from_env(name: str, default_cooldown: float, default_timeout: Optional[float] = None) -> CircuitBreaker:
+    """Build a breaker whose settings can be overridden with BREAKER_<NAME>_* variables"""
+    prefix = f"BREAKER_{name.upper()}_"
+    timeout = os.getenv(prefix + "TIMEOUT_SECONDS", default_timeout)
+    return CircuitBreaker(
+        name=name,
+        failure_rate_threshold=float(os.getenv(prefix + "FAILURE_RATE", 0.5)),
+        window_size=int(os.getenv(prefix + "WINDOW_SIZE", 10)),
+        minimum_calls=int(os.getenv(prefix + "MINIMUM_CALLS", 4)),
+        cooldown_seconds=float(os.getenv(prefix + "COOLDOWN_SECONDS", default_cooldown)),
+        timeout_seconds=float(timeout) if timeout else None,
+        timeout_workers=int(os.getenv(prefix + "TIMEOUT_WORKERS", 8)),
+    )
+
+
+# Redis and Pinecone calls are bounded by their breakers, and the same timeouts are applied to the
+# Upstash and Pinecone clients where they accept one so hung calls also free their pool threads.
+# Groq calls are bounded by the ChatGroq client timeout (LLM_TIMEOUT_SECONDS) instead.
+redis_breaker = _breaker_from_env("redis", 30.0, 2.0)
+pinecone_breaker = _breaker_from_env("pinecone", 30.0, 5.0)
+groq_breaker = _breaker_from_env("groq", 60.0)
+
+breakers: Dict[str, CircuitBreaker] = {
+    breaker.name: breaker for breaker in (redis_breaker, pinecone_breaker, groq_breaker)
+}
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    """Snapshot of every breaker, keyed by dependency name"""
+    return {name: breaker.snapshot() for name, breaker in breakers.items()}
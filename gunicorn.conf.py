@@ -0,0 +1,16 @@
+"""
+Gunicorn settings, loaded automatically from the working directory.
+
+The thread count is derived from the admission queue limits so that the queue, not gunicorn's accept
+backlog, is where bursts wait: running and queued chat requests each hold a thread, and the spare
+threads stay free for the healthcheck and for rejecting requests once the queue is full.
+"""
+import os
+import sys
+from dotenv import load_dotenv
+load_dotenv()
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # gunicorn doesn't put the project on sys.path yet
+from admission import MAX_CONCURRENCY, MAX_QUEUE, SPARE_THREADS
+
+worker_class = "gthread"
+threads = MAX_CONCURRENCY + MAX_QUEUE + SPARE_THREADS
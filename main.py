@@ -1,12 +1,17 @@
 import os
 from dotenv import load_dotenv
 import uuid
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain.prompts import PromptTemplate
 from langchain_groq import ChatGroq
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_core.runnables import RunnablePassthrough,RunnableSequence,RunnableBranch,RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.messages import BaseMessage
 from upstash_redis import Redis
 from vectorstoreloader import load_vector_store
 from better_profanity import profanity
@@ -14,6 +19,9 @@ from templates import template_details,template_for_chat_classfication
 from pydantic import BaseModel, Field
 from langchain.prompts import PromptTemplate
 from logger import logger
+from circuitbreaker import CircuitBreakerOpenError, OPEN, redis_breaker, pinecone_breaker, groq_breaker
+from admission import DeadlineExceeded, check_deadline, estimate_priority, PRIORITY_CHEAP, MAX_CONCURRENCY
+from requestprofiler import propagate
 
 class ChatMessageClassification(BaseModel):
     """Classifies user messages into predefined categories"""
@@ -34,22 +42,74 @@ class ChatMessageClassification(BaseModel):
         default=False,
         description="True if the user message is about providing contact information, else False"
     )
+
+class SpeculationStats():
+    """Tracks how often speculative retrieval is used and how much latency it saves"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0 # Not speculated on because the message looked like a greeting or contact request
+        self.saved_ms_total = 0.0
+
+    def record_hit(self, saved_ms: float) -> None:
+        with self._lock:
+            self.hits += 1
+            self.saved_ms_total += saved_ms
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def record_skip(self) -> None:
+        with self._lock:
+            self.skipped += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            attempts = self.hits + self.misses
+            return {
+                "attempts": attempts,
+                "hits": self.hits,
+                "skipped": self.skipped,
+                "hit_rate": round(self.hits / attempts, 3) if attempts else 0.0,
+                "saved_ms_total": round(self.saved_ms_total, 1),
+                "saved_ms_avg": round(self.saved_ms_total / self.hits, 1) if self.hits else 0.0,
+            }
+
 load_dotenv()
 GROQ_API_KEY=os.getenv("GROC_LLM_API")
 vector_store=load_vector_store()
 profanity.add_censor_words(['adult'])
-llm=ChatGroq(model=os.getenv("LLM_MODEL"),api_key=GROQ_API_KEY,max_tokens=400)
+llm=ChatGroq(model=os.getenv("LLM_MODEL"),api_key=GROQ_API_KEY,max_tokens=400,
+             timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", 20))) # Bound each Groq call so failures reach the breaker quickly
 structured_llm=llm.with_structured_output(ChatMessageClassification)
 retriever=vector_store.as_retriever(search_kwargs={"k":2})
 classfication_prompt=PromptTemplate.from_template(template_for_chat_classfication)
 prompt=PromptTemplate(input_variables=["history", "input", "context"],template=template_details)
+OUT_OF_SCOPE_MESSAGE = "Sorry, I’m here to help with portfolio-related questions only."
+ERROR_MESSAGE = "Sorry, we are having trouble generating reponse, please try again, later"
+# Speculative retrieval: fetch history and context while the message is being classified
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+speculation_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("SPECULATION_WORKERS", 2 * MAX_CONCURRENCY)), # Two jobs per admitted request
+    thread_name_prefix="speculative-retrieval"
+)
+speculation_stats = SpeculationStats()
 
 class ChatModelPortfolio():
     def __init__(self):
         self.redis = Redis(
             url=os.getenv("UPSTASH_REDIS_REST_URL"),
-            token=os.getenv("UPSTASH_REDIS_REST_TOKEN")
+            token=os.getenv("UPSTASH_REDIS_REST_TOKEN"),
+            rest_retries=int(os.getenv("REDIS_REST_RETRIES", 0)) # Retries wait 3s, longer than the breaker timeout
         )
+        # upstash_redis creates its httpx client with no timeout and has no option for one, so set it on the
+        # client directly; hung calls then free their breaker pool thread instead of holding it indefinitely.
+        http_client = getattr(getattr(self.redis, "_http", None), "_client", None)
+        if http_client is not None and redis_breaker.timeout_seconds is not None:
+            http_client.timeout = redis_breaker.timeout_seconds
         self.chat_deletion_time = os.getenv("CHAT_DELETION_TIME") or 600
         
     def generate_session_id(self):
@@ -63,7 +123,7 @@ class ChatModelPortfolio():
         try:
             # Use Upstash Redis to store/retrieve history as a list
             history_key = f"chat_history:{session_id}"
-            messages = self.redis.lrange(history_key, -3, -1)  # Get last 3 messages (returns list of strings)
+            messages = redis_breaker.call(self.redis.lrange, history_key, -3, -1)  # Get last 3 messages (returns list of strings)
             chat_history = ChatMessageHistory()
             for msg in messages:
                 # Messages are stored as "role:content" (e.g., "human:hello")
@@ -73,9 +133,35 @@ class ChatModelPortfolio():
                 elif role == "ai":
                     chat_history.add_ai_message(content)
             return chat_history
+        except CircuitBreakerOpenError:
+            logger.warning("Redis circuit breaker open, continuing with empty history")
+            return ChatMessageHistory()
         except Exception as e:
             logger.error(f"Error getting session history ---{e}")
             return ChatMessageHistory()
+
+    def persist_message(self, history_key: str, role: str, content: str) -> None:
+        """Append a message to the Redis history and refresh its TTL, skipping Redis while it is unavailable"""
+        def _write():
+            self.redis.rpush(history_key, f"{role}:{content}")
+            self.redis.expire(history_key, self.chat_deletion_time) # Set TTL to remove chat from redis cache
+        try:
+            redis_breaker.call(_write)
+        except CircuitBreakerOpenError:
+            logger.warning(f"Redis circuit breaker open, {role} message not persisted")
+        except Exception as e:
+            logger.error(f"Error persisting {role} message ---{e}")
+
+    def retrieve_context(self, query: str) -> list:
+        """Retrieve portfolio documents for the query, answering without context while Pinecone is unavailable"""
+        try:
+            return pinecone_breaker.call(retriever.invoke, query)
+        except CircuitBreakerOpenError:
+            logger.warning("Pinecone circuit breaker open, answering without context")
+            return []
+        except Exception as e:
+            logger.error(f"Error retrieving context ---{e}")
+            return []
     
     def filter_input(self, message: str) -> bool: # Handle inappropriate. 
         """Filter input to don't reply on inappropriate messages"""
@@ -95,12 +181,69 @@ class ChatModelPortfolio():
         if detected_category:
             return detected_category[0]
         return "Unknown"  # Fallback to Unknown if no True value is found
-    def rag_message_history(self, session_id: str, message: str) -> str:
-        """Helper method to invoke the RAG chain with message history."""
+    def classification_chain(self) -> RunnableSequence:
+        """Chain mapping a user message to its ChatMessageClassification category name"""
+        return RunnableSequence(
+            classfication_prompt,
+            structured_llm,
+            self.classfied_value_getter
+        )
+    def _timed(self, func, *args) -> Tuple[Any, float]:
+        started = time.perf_counter()
+        result = func(*args)
+        return result, (time.perf_counter() - started) * 1000
+
+    def should_speculate(self, message: str) -> bool:
+        """Whether retrieval is worth starting before the message has been classified"""
+        if not SPECULATIVE_RETRIEVAL or groq_breaker.state == OPEN:
+            return False # Nothing to overlap with if classification is going to be skipped
+        if estimate_priority(message) == PRIORITY_CHEAP:
+            speculation_stats.record_skip() # Likely a greeting or contact request; keep the pool free
+            return False
+        return True
+
+    def speculate(self, session_id: str, message: str) -> Optional[Tuple[Future, Future]]:
+        """Start the history read and retrieval in the background, ahead of classification"""
+        if not self.should_speculate(message):
+            return None
+        return (
+            speculation_executor.submit(propagate(self._timed), self.get_session_history, session_id),
+            speculation_executor.submit(propagate(self._timed), self.retrieve_context, message),
+        )
+
+    def consume_speculation(self, speculation: Optional[Tuple[Future, Future]]) -> Optional[Dict[str, Any]]:
+        """Wait for speculative results and record the latency saved versus fetching them now"""
+        if speculation is None:
+            return None
+        try:
+            waited_from = time.perf_counter()
+            history, history_ms = speculation[0].result()
+            context, context_ms = speculation[1].result()
+            waited_ms = (time.perf_counter() - waited_from) * 1000
+        except Exception as e:
+            logger.error(f"Error consuming speculative retrieval ---{e}")
+            return None
+        saved_ms = max(history_ms + context_ms - waited_ms, 0.0)
+        speculation_stats.record_hit(saved_ms)
+        logger.debug(f"Speculative retrieval hit, saved {saved_ms:.0f}ms")
+        return {"history": history, "context": context}
+
+    def discard_speculation(self, speculation: Optional[Tuple[Future, Future]], mispredicted: bool = False) -> None:
+        """Drop speculative results; only a category other than PortfolioQuestion counts as a miss"""
+        if speculation is None:
+            return
+        for future in speculation:
+            future.cancel() # Only cancels work that has not started; running lookups finish and are dropped
+        if mispredicted:
+            speculation_stats.record_miss()
+
+    def rag_message_history(self, session_id: str, message: str, prefetched: Optional[Dict[str, Any]] = None) -> str:
+        """Helper method to invoke the RAG chain with message history, reusing speculatively prefetched
+        history and context when available."""
         rag_chain_with_history = RunnableWithMessageHistory(
             runnable=RunnableSequence(
                 {
-                    "context": lambda x: retriever.invoke(x["input"]),
+                    "context": lambda x: prefetched["context"] if prefetched else self.retrieve_context(x["input"]),
                     "input": RunnablePassthrough(),
                     "history": lambda x: x.get("history", "")
                 },
@@ -108,45 +251,75 @@ class ChatModelPortfolio():
                 llm,
                 StrOutputParser()
                                 ),
-                get_session_history=self.get_session_history,
+                get_session_history=(lambda _session_id: prefetched["history"]) if prefetched else self.get_session_history,
                 input_messages_key="input",
                 history_messages_key="history"
                 )
-        return rag_chain_with_history.invoke(
+        return groq_breaker.call(
+            rag_chain_with_history.invoke,
             {"input": message},
         config={"configurable": {"session_id": session_id}}
         )
     
-    def ChatHandler(self,message,session_id)->RunnableWithMessageHistory:
+    async def astream_rag_response(self, message: str, history: List[BaseMessage], context: list) -> AsyncIterator[str]:
+        """Stream the RAG answer token by token from caller-held history and already retrieved context."""
+        permit = groq_breaker.allow_request()
+        if permit is None:
+            raise CircuitBreakerOpenError(groq_breaker.name)
+        rag_chain = RunnableSequence(prompt, llm, StrOutputParser())
+        try:
+            async for token in rag_chain.astream({"input": message, "history": history, "context": context}):
+                yield token
+        except Exception:
+            groq_breaker.record_failure(permit)
+            raise
+        except BaseException: # Cancelled or closed mid-stream: neither a success nor a failure
+            groq_breaker.release(permit)
+            raise
+        groq_breaker.record_success(permit)
+
+    def ChatHandler(self,message,session_id,deadline: Optional[float]=None)->RunnableWithMessageHistory:
         # Define the ChatHandler function here. It should return a RunnableWithMessageHistory object.
+        # deadline (time.monotonic() based) is checked once, before the message is stored or any LLM call starts,
+        # so a dropped request leaves nothing in the session history; DeadlineExceeded propagates to the caller.
         if self.filter_input(message):
-            return "Sorry, I’m here to help with portfolio-related questions only."
+            return OUT_OF_SCOPE_MESSAGE
         try:
             history_key = f"chat_history:{session_id}"
-            self.redis.rpush(history_key, f"human:{message}")
-            self.redis.expire(history_key, self.chat_deletion_time) # Set TTL to remove chat from redis cache
+            check_deadline(deadline)
+            self.persist_message(history_key, "human", message)
+            speculation = self.speculate(session_id, message)
             
             # Classification chain
-            classification_chain = RunnableSequence(
-                classfication_prompt,
-                structured_llm,
-                self.classfied_value_getter
-            )
-            category = classification_chain.invoke(message)  
+            classification_chain = self.classification_chain()
+            try:
+                category = groq_breaker.call(classification_chain.invoke, message)
+            except Exception:
+                self.discard_speculation(speculation)
+                raise
+            prefetched = None
+            if category == "PortfolioQuestion":
+                prefetched = self.consume_speculation(speculation)
+            else:
+                self.discard_speculation(speculation, mispredicted=True)
 
             branch = RunnableBranch(
                 (lambda x: x == "Greeting", RunnableLambda(lambda _: self.greetings_msg())),
-                (lambda x: x == "PortfolioQuestion", RunnableLambda(lambda _: self.rag_message_history(session_id, message))),
+                (lambda x: x == "PortfolioQuestion", RunnableLambda(lambda _: self.rag_message_history(session_id, message, prefetched))),
                 (lambda x: x == "Contact", RunnableLambda(lambda _: self.contact_info())),
-                RunnableLambda(lambda _: "Sorry, I’m here to help with portfolio-related questions only.")
+                RunnableLambda(lambda _: OUT_OF_SCOPE_MESSAGE)
             )
             response = branch.invoke(category)
             # Store AI response in Redis
-            self.redis.rpush(history_key, f"ai:{response}")
-            self.redis.expire(history_key, self.chat_deletion_time)  # Set TTL to remove chat from redis cache
+            self.persist_message(history_key, "ai", response)
             
             return response
+        except DeadlineExceeded:
+            raise
+        except CircuitBreakerOpenError as e:
+            logger.warning(f"Skipping response generation ---{e}")
+            return ERROR_MESSAGE
         except Exception as e:
             logger.error(f"Error generating response ---{e}")
-            return "Sorry, we are having trouble generating reponse, please try again, later"
+            return ERROR_MESSAGE
         
\ No newline at end of file
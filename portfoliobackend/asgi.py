@@ -2,6 +2,8 @@
 ASGI config for portfoliobackend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests are served by Django as before, and WebSocket connections are
+routed to the chat consumers in ``chatbackend.routing``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +15,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'portfoliobackend.settings')
 
-application = get_asgi_application()
+# Initialise Django before importing anything that touches models or settings
+django_asgi_app = get_asgi_application()
+
+from django.conf import settings
+from channels.routing import ProtocolTypeRouter, URLRouter #type: ignore
+from channels.security.websocket import OriginValidator #type: ignore
+from chatbackend.routing import websocket_urlpatterns
+
+application = ProtocolTypeRouter({
+    "http": django_asgi_app,
+    # Browsers don't apply CORS to WebSockets, so check the Origin against the same allow-list
+    "websocket": OriginValidator(URLRouter(websocket_urlpatterns), settings.CORS_ALLOWED_ORIGINS),
+})
@@ -73,7 +73,7 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5500"
 ]
 
-CORS_ALLOW_HEADERS = ["session_id","x-csrftoken", "Content-Type", "Authorization"]  # Allow API key in headers
+CORS_ALLOW_HEADERS = ["session_id","x-csrftoken", "Content-Type", "Authorization", "X-Request-Timeout-Ms"]  # Allow API key in headers
 CORS_ALLOW_METHODS = [
     "GET",     # Fetch data
     "POST",    # Submit data
@@ -102,7 +102,8 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'chatbackend',
     'corsheaders',
-    'rest_framework'
+    'rest_framework',
+    'channels'
 ]
 
 MIDDLEWARE = [
@@ -135,6 +136,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'portfoliobackend.wsgi.application'
+ASGI_APPLICATION = 'portfoliobackend.asgi.application'  # WebSocket chat (ws/chat/) is served from the ASGI app
 
 DATABASES = {
     'default': {
@@ -0,0 +1,219 @@
+import os
+import sys
+import time
+import hmac
+import uuid
+import random
+import functools
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Callable, ContextManager, List, Optional, Set
+from logger import logger
+
+# Opt-in sampling profiler for chat requests. Profiling is enabled per request by sending the
+# CHAT_PROFILER_TOKEN value in the X-Chat-Profile header, or for a random CHAT_PROFILER_SAMPLE_RATE
+# fraction of requests. Output is written in collapsed-stack format ("frame;frame;frame count"),
+# which flamegraph.pl and speedscope.app both open directly. Every stack starts with the name of the
+# thread it was sampled from, so retrieval and embedding work on worker threads shows up separately.
+PROFILER_TOKEN = os.getenv("CHAT_PROFILER_TOKEN") or ""
+PROFILER_SAMPLE_RATE = float(os.getenv("CHAT_PROFILER_SAMPLE_RATE", 0))
+PROFILER_DIR = os.getenv("CHAT_PROFILER_DIR", "profiles")
+PROFILER_INTERVAL = float(os.getenv("CHAT_PROFILER_INTERVAL_MS", 5)) / 1000
+PROFILER_MAX_BYTES = int(os.getenv("CHAT_PROFILER_MAX_BYTES", 50 * 1024 * 1024))
+PROFILE_HEADER = "X-Chat-Profile"
+PROFILE_SUFFIX = ".collapsed"
+
+_disabled = nullcontext()
+_active_sampler: ContextVar[Optional["StackSampler"]] = ContextVar("active_sampler", default=None)
+_instrument_lock = threading.Lock()
+_langchain_instrumented = False
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    # Keep paths short but still tell langchain, tokenizers and torch apart
+    if "site-packages" in filename:
+        filename = filename.split("site-packages", 1)[1].lstrip(os.sep)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _is_idle_worker(frames: List) -> bool:
+    # An executor thread blocked in work_queue.get() inside concurrent.futures' _worker is waiting for work
+    names = [frame.f_code.co_name for frame in frames]
+    return "_worker" in names and names[names.index("_worker") + 1:names.index("_worker") + 2] == ["get"]
+
+
+class StackSampler():
+    """
+    Samples call stacks at a fixed interval from a background thread.
+
+    Only the request thread and threads explicitly attached while they run work submitted by this
+    request (through `propagate`) are sampled, so concurrent requests never leak into the profile.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._attached: Set[int] = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="chat-profiler", daemon=True)
+
+    def attach(self, thread_id: int) -> None:
+        self._attached.add(thread_id)
+
+    def detach(self, thread_id: int) -> None:
+        self._attached.discard(thread_id)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            targets = {self.thread_id} | set(self._attached)
+            for thread_id in targets:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(frame)
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                stack.reverse()
+                if thread_id != self.thread_id and _is_idle_worker(stack):
+                    continue
+                thread_name = "request" if thread_id == self.thread_id else names.get(thread_id, str(thread_id))
+                self.samples[";".join([thread_name] + [_frame_label(frame) for frame in stack])] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def _rotate(directory: str, max_bytes: int) -> None:
+    """Delete the oldest profiles until the directory is back under `max_bytes`"""
+    profiles = [
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(PROFILE_SUFFIX)
+    ]
+    sizes = {}
+    for path in profiles:
+        try:
+            sizes[path] = (os.path.getmtime(path), os.path.getsize(path))
+        except FileNotFoundError:
+            continue  # Removed by a concurrent rotation
+    oldest_first = sorted(sizes, key=lambda path: sizes[path][0])
+    total = sum(size for _, size in sizes.values())
+    while oldest_first and total > max_bytes:
+        oldest = oldest_first.pop(0)
+        total -= sizes[oldest][1]
+        try:
+            os.remove(oldest)
+        except FileNotFoundError:
+            pass
+
+
+def _write_profile(samples: Counter, label: str) -> Optional[str]:
+    try:
+        os.makedirs(PROFILER_DIR, exist_ok=True)
+        label = "".join(c for c in label if c.isalnum() or c == "-")[:36]  # label comes from the client
+        # Millisecond timestamp plus a random suffix so turns profiled close together don't overwrite each other
+        now = time.time()
+        timestamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}"
+        filename = f"chat-{timestamp}-{label}-{uuid.uuid4().hex[:6]}{PROFILE_SUFFIX}"
+        path = os.path.join(PROFILER_DIR, filename)
+        with open(path, "w") as profile_file:
+            for stack, count in samples.most_common():
+                profile_file.write(f"{stack} {count}\n")
+        _rotate(PROFILER_DIR, PROFILER_MAX_BYTES)
+        return path
+    except Exception as e:
+        logger.error(f"Error writing request profile ---{e}")
+        return None
+
+
+def _instrument_langchain_executor() -> None:
+    """
+    Make langchain's executor attach its worker threads to the submitting request's profiler.
+
+    RunnableParallel steps (where retrieval and the MiniLM embedding run) are submitted to a
+    ContextThreadPoolExecutor; wrapping its submit with `propagate` ties each worker to the request
+    that submitted the work. Installed on the first profiled request, so it costs nothing until then.
+    """
+    global _langchain_instrumented
+    with _instrument_lock:
+        if _langchain_instrumented:
+            return
+        _langchain_instrumented = True
+        try:
+            from langchain_core.runnables.config import ContextThreadPoolExecutor
+        except ImportError:
+            logger.warning("langchain executor not found, profiles will not include parallel chain steps")
+            return
+        original_submit = ContextThreadPoolExecutor.submit
+
+        @functools.wraps(original_submit)
+        def submit(self, func, *args, **kwargs):
+            return original_submit(self, propagate(func), *args, **kwargs)
+        ContextThreadPoolExecutor.submit = submit
+
+
+@contextmanager
+def _profile(label: str):
+    _instrument_langchain_executor()
+    sampler = StackSampler(threading.get_ident(), PROFILER_INTERVAL)
+    started = time.perf_counter()
+    sampler.start()
+    token = _active_sampler.set(sampler)
+    try:
+        yield
+    finally:
+        _active_sampler.reset(token)
+        sampler.stop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        path = _write_profile(sampler.samples, label)
+        logger.info(f"Profiled chat request {label} in {elapsed_ms:.0f}ms "
+                    f"({sum(sampler.samples.values())} samples) -> {path}")
+
+
+def propagate(func: Callable) -> Callable:
+    """
+    Wrap `func` before submitting it to a thread pool so the profiler of the submitting request
+    (if any) also samples the worker thread while it runs. Returns `func` unchanged when no
+    profile is active.
+    """
+    sampler = _active_sampler.get()
+    if sampler is None:
+        return func
+
+    @functools.wraps(func)
+    def run_attached(*args, **kwargs):
+        thread_id = threading.get_ident()
+        sampler.attach(thread_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sampler.detach(thread_id)
+    return run_attached
+
+
+def profile_request(header_value: Optional[str], label: str) -> ContextManager:
+    """
+    Return a context manager that profiles the wrapped block if profiling applies to this request.
+
+    Args:
+        header_value: Value of the X-Chat-Profile request header, if any
+        label: Identifier included in the output filename (e.g. the session id)
+
+    Returns:
+        ContextManager: A sampling profiler, or a no-op context when profiling is disabled
+    """
+    if header_value and PROFILER_TOKEN and hmac.compare_digest(header_value.encode(), PROFILER_TOKEN.encode()):
+        return _profile(label)
+    if PROFILER_SAMPLE_RATE > 0 and random.random() < PROFILER_SAMPLE_RATE:
+        return _profile(label)
+    return _disabled
@@ -4,6 +4,7 @@ from langchain_huggingface import HuggingFaceEmbeddings
 from pinecone import Pinecone
 from langchain_pinecone import PineconeVectorStore
 from logger import logger
+from circuitbreaker import pinecone_breaker
 
 # Initialize Pinecone client (add your API key and environment)
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")  # Set this in your environment
@@ -26,13 +27,18 @@ def load_vector_store() -> Optional[PineconeVectorStore]:
         )
 
         # Initialize Pinecone client and verify index exists
-        pc = Pinecone(api_key=PINECONE_API_KEY)
+        # Use the breaker timeout on the client too, so queries that hang release their breaker pool thread
+        client_options = {"timeout": pinecone_breaker.timeout_seconds} if pinecone_breaker.timeout_seconds else {}
+        try:
+            pc = Pinecone(api_key=PINECONE_API_KEY, **client_options)
+        except TypeError:
+            pc = Pinecone(api_key=PINECONE_API_KEY)  # Older SDKs have no client timeout; the breaker still bounds calls
         if PINECONE_INDEX_NAME not in pc.list_indexes().names():
             raise ValueError(f"Pinecone index '{PINECONE_INDEX_NAME}' not found")
 
         # Load existing vector store
         vector_store = PineconeVectorStore(
-            index_name=PINECONE_INDEX_NAME,
+            index=pc.Index(PINECONE_INDEX_NAME),
             embedding=hf_embeddings
         )
         